@@ -17,7 +17,9 @@ interface ModerationResult {
 interface AnalysisResult {
   is_safe: boolean;
   description: string | null;
-  embedding: number[] | null;
+  // base64 float16 by default, number[] when requested with ?format=json_list
+  embedding: string | number[] | null;
+  embedding_format?: 'float16_base64' | 'json_list' | null;
   moderation_details: ModerationResult;
 }
 
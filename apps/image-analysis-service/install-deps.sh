@@ -35,10 +35,10 @@ fi
 
 # Install dependencies in order to avoid conflicts
 echo "Step 1: Installing core dependencies..."
-pip install fastapi uvicorn python-multipart pillow requests python-dotenv
+pip install fastapi uvicorn python-multipart pillow numpy "httpx[http2]" python-dotenv orjson pybase64 cachetools async-lru lmdb redis
 
 echo "Step 2: Installing vector search dependencies..."
-pip install qdrant-client sentence-transformers
+pip install qdrant-client sentence-transformers sqlite-vec
 
 echo "Step 3: Installing OpenCV..."
 pip install opencv-python-headless
@@ -1,17 +1,63 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from typing import Optional, List, Literal, Union
+import asyncio
+import hashlib
+import io
 import os
+from contextlib import asynccontextmanager
+import numpy as np
+import orjson
+import pybase64
+from async_lru import alru_cache
 from dotenv import load_dotenv
 
+from services.cache import ResultCache
 from services.content_moderation import ContentModerationService
+from services.embedding_disk_cache import EmbeddingDiskCache
+from services.executor import run_cpu_bound
 from services.image_description import ImageDescriptionService
+from services.preprocess import PreparedImage, prepare
 from services.vector_search import VectorSearchService
 
 load_dotenv()
 
-app = FastAPI(title="Image Analysis Service", version="1.0.0")
+
+class ORJSONResponse(JSONResponse):
+    """JSON responses via orjson, which is much faster on long float lists"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+# Initialize services
+content_moderator = ContentModerationService()
+image_descriptor = ImageDescriptionService()
+vector_search = VectorSearchService()
+result_cache = ResultCache()
+embedding_disk_cache = EmbeddingDiskCache(namespace=vector_search.model_name)
+
+# Describe images while moderation is still running; unsafe images waste a description call
+speculative_describe = os.getenv("SPECULATIVE_DESCRIBE", "1") == "1"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await vector_search.ensure_collection()
+    if os.getenv("CLIP_PRELOAD", "0") == "1":
+        # Requests that arrive before the load finishes wait on the same load
+        app.state.clip_preload = asyncio.create_task(vector_search.preload_model())
+
+    yield
+
+    await image_descriptor.aclose()
+    await vector_search.close()
+    await result_cache.close()
+
+
+app = FastAPI(title="Image Analysis Service", version="1.0.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -22,16 +68,93 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-content_moderator = ContentModerationService()
-image_descriptor = ImageDescriptionService()
-vector_search = VectorSearchService()
+
+async def read_and_hash(file: UploadFile, chunk_size: int = 1 << 20) -> PreparedImage:
+    """Read an upload in chunks, hashing as we go, without decoding it"""
+    digest = hashlib.sha256()
+    buffer = io.BytesIO()
+    while chunk := await file.read(chunk_size):
+        digest.update(chunk)
+        buffer.write(chunk)
+    return prepare(buffer.getvalue(), digest.digest())
+
+
+async def moderate(image: PreparedImage) -> dict:
+    """Content moderation, cached by image hash, model and threshold"""
+    key = f"mod:{content_moderator.cache_id}:{image.sha256.hex()}"
+    result = await result_cache.get(key)
+    if result is None:
+        result = await content_moderator.check_prepared(image)
+        # Failed checks default to safe; never cache those
+        if "error" not in result:
+            await result_cache.set(key, result)
+    return result
+
+
+async def describe(image: PreparedImage) -> str:
+    """Image description, cached by image hash, provider and model"""
+    key = f"desc:{image_descriptor.cache_id}:{image.sha256.hex()}"
+    description = await result_cache.get(key)
+    if description is None:
+        description = await image_descriptor.describe_prepared(image)
+        if not image_descriptor.is_error(description):
+            await result_cache.set(key, description)
+    return description
+
+
+@alru_cache(maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", "2048")))
+async def _embed_normalized(text: str) -> np.ndarray:
+    embedding = await vector_search.generate_embedding(text)
+    # The cached array is shared by every caller
+    embedding.setflags(write=False)
+    return embedding
+
+
+def normalize_text(text: str) -> str:
+    # CLIP's tokenizer lowercases and collapses whitespace itself, so normalizing
+    # first raises cache hit rates without changing the embedding
+    return " ".join(text.split()).lower()
+
+
+async def embed(text: str) -> np.ndarray:
+    """CLIP text embedding, LRU-cached on the normalized text"""
+    return await _embed_normalized(normalize_text(text))
+
+
+async def embed_persistent(text: str) -> np.ndarray:
+    """Like embed, but also backed by the on-disk cache shared across workers"""
+    normalized = normalize_text(text)
+    cached = await run_cpu_bound(embedding_disk_cache.get, normalized)
+    if cached is not None:
+        return cached
+
+    embedding = await _embed_normalized(normalized)
+    await run_cpu_bound(embedding_disk_cache.put, normalized, embedding)
+    return embedding
+
+
+EmbeddingFormat = Literal["float16_base64", "json_list"]
+
+
+def encode_embedding(embedding: np.ndarray, embedding_format: EmbeddingFormat) -> Union[str, List[float]]:
+    """Encode an embedding for the wire (float16_base64 is ~8x smaller than a JSON list)"""
+    if embedding_format == "json_list":
+        return embedding.tolist()
+    # Explicit little-endian, as documented, whatever the host byte order
+    return pybase64.b64encode_as_string(embedding.astype("<f2").tobytes())
 
 
 class AnalysisResponse(BaseModel):
     is_safe: bool
     description: Optional[str]
-    embedding: Optional[List[float]]
+    embedding: Optional[Union[str, List[float]]] = Field(
+        description=(
+            "With embedding_format float16_base64: base64 of little-endian float16 values, "
+            "decode with np.frombuffer(base64.b64decode(s), dtype=np.float16). "
+            "With json_list: a list of floats."
+        )
+    )
+    embedding_format: Optional[EmbeddingFormat] = None
     moderation_details: dict
 
 
@@ -52,25 +175,42 @@ async def health_check():
         "status": "healthy",
         "services": {
             "content_moderation": "ready",
-            "image_description": "ready" if image_descriptor.is_available() else "unavailable",
+            "image_description": "ready" if await image_descriptor.is_available() else "unavailable",
             "vector_search": "ready" if vector_search.is_available() else "unavailable"
         }
     }
 
 
 @app.post("/api/analyze", response_model=AnalysisResponse)
-async def analyze_image(file: UploadFile = File(...)):
+async def analyze_image(
+    file: UploadFile = File(...),
+    embedding_format: EmbeddingFormat = Query("float16_base64", alias="format")
+):
     """
     Analyze image for content moderation and generate description + embeddings
+
+    Pass ?format=json_list to get the embedding as a plain list of floats.
     """
     try:
-        # Read image file
-        image_bytes = await file.read()
+        # Read image file (decoded once, and only if a step isn't cached)
+        image = await read_and_hash(file)
+
+        # Start the description now so it overlaps moderation; dropped if unsafe
+        describe_task = None
+        if speculative_describe and await image_descriptor.is_available():
+            describe_task = asyncio.create_task(describe(image))
 
         # Step 1: Content Moderation (REQUIRED)
-        moderation_result = await content_moderator.check_image(image_bytes)
+        try:
+            moderation_result = await moderate(image)
+        except BaseException:
+            if describe_task:
+                describe_task.cancel()
+            raise
 
         if not moderation_result["is_safe"]:
+            if describe_task:
+                describe_task.cancel()
             return AnalysisResponse(
                 is_safe=False,
                 description=None,
@@ -82,17 +222,18 @@ async def analyze_image(file: UploadFile = File(...)):
         description = None
         embedding = None
 
-        if image_descriptor.is_available():
-            description = await image_descriptor.generate_description(image_bytes)
+        if describe_task or await image_descriptor.is_available():
+            description = await describe_task if describe_task else await describe(image)
 
             # Step 3: Generate embeddings
             if vector_search.is_available() and description:
-                embedding = await vector_search.generate_embedding(description)
+                embedding = await embed(description)
 
         return AnalysisResponse(
             is_safe=True,
             description=description,
-            embedding=embedding,
+            embedding=encode_embedding(embedding, embedding_format) if embedding is not None else None,
+            embedding_format=embedding_format if embedding is not None else None,
             moderation_details=moderation_result
         )
 
@@ -106,8 +247,7 @@ async def moderate_image(file: UploadFile = File(...)):
     Check if image is safe (content moderation only)
     """
     try:
-        image_bytes = await file.read()
-        result = await content_moderator.check_image(image_bytes)
+        result = await moderate(await read_and_hash(file))
 
         return {
             "is_safe": result["is_safe"],
@@ -125,11 +265,10 @@ async def describe_image(file: UploadFile = File(...)):
     Generate description for an image
     """
     try:
-        if not image_descriptor.is_available():
+        if not await image_descriptor.is_available():
             raise HTTPException(status_code=503, detail="Image description service unavailable")
 
-        image_bytes = await file.read()
-        description = await image_descriptor.generate_description(image_bytes)
+        description = await describe(await read_and_hash(file))
 
         return {"description": description}
 
@@ -146,7 +285,8 @@ async def search_similar(request: SearchRequest):
         if not vector_search.is_available():
             raise HTTPException(status_code=503, detail="Vector search service unavailable")
 
-        results = await vector_search.search(request.query, request.limit)
+        query_embedding = await embed(request.query)
+        results = await vector_search.search(request.query, request.limit, query_embedding=query_embedding)
 
         return [
             SearchResult(
@@ -177,7 +317,7 @@ async def index_asset(request: IndexAssetRequest):
         if not vector_search.is_available():
             raise HTTPException(status_code=503, detail="Vector search service unavailable")
 
-        embedding = await vector_search.generate_embedding(request.description)
+        embedding = await embed_persistent(request.description)
         await vector_search.index_asset(
             asset_id=request.asset_id,
             description=request.description,
@@ -194,6 +334,24 @@ async def index_asset(request: IndexAssetRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """
+    Hit/miss counters for the embedding, result, and search caches
+    """
+    embedding_info = _embed_normalized.cache_info()
+    return {
+        "embeddings": {
+            "hits": embedding_info.hits,
+            "misses": embedding_info.misses,
+            "size": embedding_info.currsize,
+            "max_size": embedding_info.maxsize
+        },
+        "results": result_cache.stats(),
+        "search": await vector_search.semantic_cache.stats()
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
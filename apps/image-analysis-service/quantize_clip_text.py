@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Export the CLIP text tower to ONNX, quantize it to INT8, and check it against FP32
+
+Usage:
+    python quantize_clip_text.py
+    python quantize_clip_text.py --fp16
+    python quantize_clip_text.py --texts ./sample_queries.txt --validate-only
+
+The model and tokenizer are written to models/clip-text-int8. Enable them with
+CLIP_ONNX_INT8=1 (and CLIP_ONNX_DIR if stored elsewhere). With --fp16, an FP16
+model for GPU hosts is written next to it; enable it with CLIP_ONNX_FP16=1.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import onnx
+import torch
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from onnxruntime.transformers.float16 import convert_float_to_float16
+from sentence_transformers import SentenceTransformer
+from transformers import CLIPModel, CLIPTokenizerFast
+
+from services.clip_onnx import FP16_MODEL_FILE, MODEL_FILE, ONNXTextEncoder
+
+# Typical asset search queries, of varied length so padding is exercised
+DEFAULT_TEXTS = [
+    "dog",
+    "blue sky with mountains",
+    "a red car parked on a city street at night",
+    "team photo in the office",
+    "logo on white background",
+    "people hiking through a pine forest in autumn with a lake in the distance",
+    "screenshot of a dashboard with charts",
+    "sunset over the ocean",
+]
+
+
+class TextTower(torch.nn.Module):
+    """Text encoder plus projection, i.e. CLIPModel.get_text_features"""
+
+    def __init__(self, clip: CLIPModel):
+        super().__init__()
+        self.clip = clip
+
+    def forward(self, input_ids, attention_mask):
+        output = self.clip.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+        # Newer transformers return a model output instead of the tensor
+        return output if isinstance(output, torch.Tensor) else output.pooler_output
+
+
+def export(model_name: str, output_dir: str, fp16: bool):
+    tokenizer = CLIPTokenizerFast.from_pretrained(model_name)
+    tower = TextTower(CLIPModel.from_pretrained(model_name)).eval()
+    tokens = tokenizer(DEFAULT_TEXTS[:2], padding=True, return_tensors="pt")
+
+    os.makedirs(output_dir, exist_ok=True)
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    print(f"Exporting {model_name} text tower -> {fp32_path}")
+    torch.onnx.export(
+        tower,
+        (tokens["input_ids"], tokens["attention_mask"]),
+        fp32_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["text_embeds"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "text_embeds": {0: "batch"},
+        },
+        opset_version=17,
+        dynamo=False,
+    )
+    tokenizer.save_pretrained(output_dir)
+
+    int8_path = os.path.join(output_dir, MODEL_FILE)
+    print(f"Quantizing {fp32_path} -> {int8_path}")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    if fp16:
+        fp16_path = os.path.join(output_dir, FP16_MODEL_FILE)
+        print(f"Converting {fp32_path} -> {fp16_path}")
+        # float32 inputs/outputs, so callers and Qdrant see the same types
+        onnx.save(convert_float_to_float16(onnx.load(fp32_path), keep_io_types=True), fp16_path)
+
+
+def validate(output_dir: str, model_file: str, texts: list) -> float:
+    """Lowest cosine similarity between FP32 and ONNX model embeddings of texts"""
+    expected = SentenceTransformer("clip-ViT-B-32", device="cpu").encode(texts, normalize_embeddings=True)
+    encoder = ONNXTextEncoder(output_dir, model_file=model_file)
+    actual = encoder.encode(texts, batch_size=len(texts), normalize_embeddings=True)
+    similarities = np.sum(expected * actual, axis=1)
+
+    for text, similarity in zip(texts, similarities):
+        print(f"  {similarity:.4f}  {text}")
+    print(f"Cosine similarity: min {similarities.min():.4f}, mean {similarities.mean():.4f}")
+    return float(similarities.min())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="openai/clip-vit-base-patch32", help="Checkpoint behind clip-ViT-B-32")
+    parser.add_argument("--output", default="models/clip-text-int8")
+    parser.add_argument("--texts", help="File with one sample query per line")
+    parser.add_argument("--min-similarity", type=float, default=0.98)
+    parser.add_argument("--fp16", action="store_true", help="Also build the FP16 model for CUDA")
+    parser.add_argument("--validate-only", action="store_true")
+    args = parser.parse_args()
+
+    texts = DEFAULT_TEXTS
+    if args.texts:
+        with open(args.texts) as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    if not args.validate_only:
+        export(args.model, args.output, args.fp16)
+
+    # Rankings shift if embeddings drift too far from the FP32 ones already
+    # stored in Qdrant
+    model_files = [MODEL_FILE, FP16_MODEL_FILE] if args.fp16 else [MODEL_FILE]
+    for model_file in model_files:
+        print(f"Validating {model_file}")
+        similarity = validate(args.output, model_file, texts)
+        if similarity < args.min_similarity:
+            print(f"❌ Similarity below {args.min_similarity}, do not deploy {model_file}")
+            sys.exit(1)
+
+    print("✅ ONNX models ready")
+
+
+if __name__ == "__main__":
+    main()
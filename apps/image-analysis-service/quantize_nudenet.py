@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Produce an INT8 NudeNet model for CPU deployments and check it against FP32
+
+Usage:
+    python quantize_nudenet.py --samples ./calibration_images
+    python quantize_nudenet.py --samples ./calibration_images --validate-only
+
+The quantized model is written to models/320n.int8.onnx. Enable it with
+NUDENET_INT8=1 (and NUDENET_INT8_MODEL_PATH if stored elsewhere).
+"""
+import argparse
+import os
+import sys
+
+import nudenet
+from nudenet import NudeDetector
+from nudenet.nudenet import _read_image
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_static,
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def list_images(sample_dir: str) -> list:
+    return sorted(
+        os.path.join(sample_dir, name)
+        for name in os.listdir(sample_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+class ImageCalibReader(CalibrationDataReader):
+    """Feeds sample images through NudeNet's own preprocessing"""
+
+    def __init__(self, sample_dir: str, input_name: str, input_size: int):
+        self.images = iter(list_images(sample_dir))
+        self.input_name = input_name
+        self.input_size = input_size
+
+    def get_next(self):
+        path = next(self.images, None)
+        if path is None:
+            return None
+        blob = _read_image(path, self.input_size)[0]
+        return {self.input_name: blob}
+
+
+def labels_for(detector: NudeDetector, path: str, threshold: float) -> set:
+    return {d["class"] for d in detector.detect(path) if d["score"] > threshold}
+
+
+def validate(fp32_path: str, int8_path: str, sample_dir: str, threshold: float) -> float:
+    """Share of images where FP32 and INT8 detect the same label set"""
+    fp32 = NudeDetector(model_path=fp32_path)
+    int8 = NudeDetector(model_path=int8_path)
+    images = list_images(sample_dir)
+
+    matches = 0
+    for path in images:
+        expected = labels_for(fp32, path, threshold)
+        actual = labels_for(int8, path, threshold)
+        if expected == actual:
+            matches += 1
+        else:
+            print(f"  mismatch {os.path.basename(path)}: fp32={sorted(expected)} int8={sorted(actual)}")
+
+    agreement = matches / len(images) if images else 0.0
+    print(f"Label agreement: {matches}/{len(images)} ({agreement:.1%})")
+    return agreement
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", required=True, help="Directory of representative calibration images")
+    parser.add_argument("--output", default="models/320n.int8.onnx")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("CONTENT_MODERATION_THRESHOLD", "0.6")))
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    parser.add_argument("--validate-only", action="store_true")
+    args = parser.parse_args()
+
+    fp32_path = os.path.join(os.path.dirname(nudenet.__file__), "320n.onnx")
+
+    if not args.validate_only:
+        detector = NudeDetector()
+        model_input = detector.onnx_session.get_inputs()[0]
+
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        print(f"Quantizing {fp32_path} -> {args.output}")
+        quantize_static(
+            fp32_path,
+            args.output,
+            calibration_data_reader=ImageCalibReader(args.samples, model_input.name, model_input.shape[2]),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QInt8,
+            weight_type=QuantType.QInt8,
+        )
+
+    # Some layers are sensitive to quantization; refuse to ship a model that
+    # disagrees with FP32 on too many samples
+    agreement = validate(fp32_path, args.output, args.samples, args.threshold)
+    if agreement < args.min_agreement:
+        print(f"❌ Agreement below {args.min_agreement:.0%}, do not deploy this model")
+        sys.exit(1)
+
+    print("✅ INT8 model ready")
+
+
+if __name__ == "__main__":
+    main()
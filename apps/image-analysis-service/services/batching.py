@@ -0,0 +1,68 @@
+import asyncio
+from typing import Awaitable, Callable
+
+
+class BatchQueue:
+    """
+    Coalesce items submitted within a short window into one handler call
+
+    The handler receives a list of items and must return a list of results in
+    the same order. Batches are dispatched as separate tasks, so a slow batch
+    does not hold back the next one.
+    """
+
+    def __init__(self, handler: Callable[[list], Awaitable[list]], maxsize: int = 8, wait_ms: int = 25):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.wait = wait_ms / 1000
+        self._queue = None
+        self._worker = None
+        self._in_flight = set()
+
+    async def submit(self, item):
+        """Queue an item and wait for its result"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.wait
+
+            while len(batch) < self.maxsize:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Callers that gave up while queued don't need a result
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if batch:
+                task = asyncio.create_task(self._dispatch(batch))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch: list):
+        try:
+            results = await self.handler([item for item, _ in batch])
+            # zip would silently leave the extra callers waiting forever
+            if len(results) != len(batch):
+                raise ValueError(f"Batch handler returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,84 @@
+import asyncio
+import os
+from typing import Any, Optional
+import orjson
+from cachetools import TTLCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    from redis.asyncio import Redis
+except ImportError:  # Redis is optional; the local LRU still works without it
+    Redis = None
+
+
+class ResultCache:
+    """
+    Content-addressed cache for analysis results
+
+    A process-local LRU sits in front of an optional shared Redis (REDIS_URL),
+    so repeated uploads skip the models entirely.
+    """
+
+    def __init__(self):
+        self.ttl = int(os.getenv("CACHE_TTL_SECONDS", "86400"))
+        self.redis_url = os.getenv("REDIS_URL")
+        self._local = TTLCache(maxsize=int(os.getenv("RESULT_CACHE_SIZE", "1024")), ttl=self.ttl)
+        self._lock = asyncio.Lock()
+        self._redis = None
+        self.hits = 0
+        self.misses = 0
+
+        if self.redis_url:
+            if Redis is None:
+                logger.warning("REDIS_URL set but redis package not installed, using local cache only")
+            else:
+                self._redis = Redis.from_url(self.redis_url)
+                logger.info("Result cache backed by Redis")
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        async with self._lock:
+            value = self._local.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if self._redis:
+            try:
+                raw = await self._redis.get(key)
+                if raw is not None:
+                    value = orjson.loads(raw)
+                    async with self._lock:
+                        self._local[key] = value
+                    self.hits += 1
+                    return value
+            except Exception as e:
+                logger.warning(f"Redis cache read failed: {e}")
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any):
+        """Store a JSON-serializable value under key"""
+        async with self._lock:
+            self._local[key] = value
+
+        if self._redis:
+            try:
+                await self._redis.set(key, orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY), ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"Redis cache write failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._local),
+            "redis": self._redis is not None
+        }
+
+    async def close(self):
+        if self._redis:
+            await self._redis.aclose()
@@ -0,0 +1,58 @@
+import os
+from typing import List, Optional
+import numpy as np
+import onnxruntime as ort
+from transformers import CLIPTokenizerFast
+
+# CLIP's text tower has 77 positions
+MAX_TOKENS = 77
+MODEL_FILE = "model.int8.onnx"
+# FP16 weights with float32 inputs/outputs, for CUDA
+FP16_MODEL_FILE = "model.fp16.onnx"
+
+
+class ONNXTextEncoder:
+    """
+    CLIP text tower exported to ONNX (see quantize_clip_text.py)
+
+    Drop-in for the SentenceTransformer text path: encode() takes the same
+    arguments and returns a float32 array of shape (len(texts), 512). Runs the
+    INT8 model on CPU by default, or the FP16 model on CUDA.
+    """
+
+    def __init__(self, model_dir: str, model_file: str = MODEL_FILE, providers: Optional[list] = None):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=providers or ["CPUExecutionProvider"]
+        )
+        self.tokenizer = CLIPTokenizerFast.from_pretrained(model_dir)
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = False,
+        convert_to_numpy: bool = True
+    ) -> np.ndarray:
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=MAX_TOKENS,
+                return_tensors="np"
+            )
+            embeddings.append(self.session.run(None, {
+                "input_ids": tokens["input_ids"].astype(np.int64),
+                "attention_mask": tokens["attention_mask"].astype(np.int64)
+            })[0])
+
+        result = np.concatenate(embeddings).astype(np.float32, copy=False)
+        if normalize_embeddings:
+            result /= np.linalg.norm(result, axis=1, keepdims=True)
+        return result
@@ -1,10 +1,16 @@
-import io
 import os
+import tempfile
 from typing import Dict
+import numpy as np
+import onnxruntime
 from PIL import Image
+import nudenet
 from nudenet import NudeDetector
 import logging
 
+from services.executor import run_cpu_bound
+from services.preprocess import PreparedImage, prepare
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,18 +22,94 @@ class ContentModerationService:
     def __init__(self):
         self.threshold = float(os.getenv("CONTENT_MODERATION_THRESHOLD", "0.6"))
         self.detector = None
+        # Weights in use, part of result cache keys with the threshold
+        self.model_name = "320n.onnx"
         self._initialize_detector()
 
+    @property
+    def cache_id(self) -> str:
+        """Identifies the model and threshold behind a verdict, for result cache keys"""
+        return f"{self.model_name}:{self.threshold}"
+
     def _initialize_detector(self):
         """Initialize NudeNet detector"""
         try:
             logger.info("Initializing NudeNet detector...")
             self.detector = NudeDetector()
+
+            # Swap NudeNet's CPU session for one on the fastest available provider.
+            # NudeNet's own preprocessing (letterbox) and postprocessing (NMS, labels)
+            # keep working because they only go through detector.onnx_session.
+            sess_options = onnxruntime.SessionOptions()
+            # Parallelism comes from the shared executor (one request per thread);
+            # ORT's own thread pools on top of that would oversubscribe the CPU
+            sess_options.intra_op_num_threads = 1
+            sess_options.inter_op_num_threads = 1
+            model_path = os.path.join(os.path.dirname(nudenet.__file__), "320n.onnx")
+            providers = self._get_providers()
+            if os.getenv("NUDENET_INT8", "0") == "1":
+                # INT8 model produced offline by quantize_nudenet.py (CPU deployments)
+                int8_model_path = os.getenv("NUDENET_INT8_MODEL_PATH", "models/320n.int8.onnx")
+                if os.path.exists(int8_model_path):
+                    model_path = int8_model_path
+                    providers = ["CPUExecutionProvider"]
+                    sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+                else:
+                    # Still replace NudeNet's session so the thread limits apply
+                    logger.warning(f"INT8 model not found at {int8_model_path}, using FP32 NudeNet")
+
+            if os.path.exists(model_path) and hasattr(self.detector, "onnx_session"):
+                self.detector.onnx_session = onnxruntime.InferenceSession(
+                    model_path,
+                    sess_options=sess_options,
+                    providers=providers
+                )
+                self.model_name = os.path.basename(model_path)
+                logger.info(f"NudeNet running {os.path.basename(model_path)} on {self.detector.onnx_session.get_providers()[0]}")
+
             logger.info("NudeNet detector initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize NudeNet: {e}")
             raise
 
+    def _get_providers(self) -> list:
+        """ONNX Runtime providers in preference order: TensorRT (FP16), CUDA, CPU"""
+        available = onnxruntime.get_available_providers()
+        providers = []
+
+        if "TensorrtExecutionProvider" in available:
+            # Cache built engines on disk so only the first cold start pays the build
+            trt_options = {"trt_fp16_enable": True}
+            cache_path = os.getenv("NUDENET_TRT_CACHE_DIR", "/var/cache/nudenet_trt")
+            try:
+                os.makedirs(cache_path, exist_ok=True)
+                trt_options["trt_engine_cache_enable"] = True
+                trt_options["trt_engine_cache_path"] = cache_path
+            except OSError as e:
+                logger.warning(f"TensorRT engine cache disabled: {e}")
+            providers.append(("TensorrtExecutionProvider", trt_options))
+
+        if "CUDAExecutionProvider" in available:
+            providers.append("CUDAExecutionProvider")
+
+        providers.append("CPUExecutionProvider")
+        return providers
+
+    def _detect(self, image_bgr: np.ndarray) -> list:
+        """Run NudeNet on an in-memory BGR array, falling back to a tmpfs file"""
+        try:
+            return self.detector.detect(np.ascontiguousarray(image_bgr))
+        except (TypeError, AttributeError):
+            # Older NudeNet releases only accept a file path. Use a unique file on
+            # tmpfs so concurrent requests don't overwrite each other's image.
+            temp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+            with tempfile.NamedTemporaryFile(suffix=".jpg", dir=temp_dir, delete=False) as temp_file:
+                Image.fromarray(np.ascontiguousarray(image_bgr[:, :, ::-1])).save(temp_file, format='JPEG')
+            try:
+                return self.detector.detect(temp_file.name)
+            finally:
+                os.remove(temp_file.name)
+
     async def check_image(self, image_bytes: bytes) -> Dict:
         """
         Check if image contains inappropriate content
@@ -35,6 +117,18 @@ class ContentModerationService:
         Args:
             image_bytes: Image file as bytes
 
+        Returns:
+            Same as check_prepared
+        """
+        return await self.check_prepared(prepare(image_bytes))
+
+    async def check_prepared(self, image: PreparedImage) -> Dict:
+        """
+        Check if a prepared image contains inappropriate content
+
+        Args:
+            image: Image from services.preprocess.prepare
+
         Returns:
             Dict with keys:
             - is_safe: boolean
@@ -42,28 +136,13 @@ class ContentModerationService:
             - detections: list of detected labels
             - confidence_scores: dict of label -> score
         """
+        return await run_cpu_bound(self._check_image_sync, image)
+
+    def _check_image_sync(self, image: PreparedImage) -> Dict:
+        """Decode and run NudeNet; blocking, called on the shared executor"""
         try:
-            # Convert bytes to PIL Image
-            image = Image.open(io.BytesIO(image_bytes))
-
-            # Convert RGBA to RGB if needed
-            if image.mode == 'RGBA':
-                # Create white background
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[3])  # 3 is the alpha channel
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
-
-            # Save to temporary path for NudeNet
-            temp_path = "/tmp/temp_image.jpg"
-            image.save(temp_path, format='JPEG')
-
-            # Run detection
-            detections = self.detector.detect(temp_path)
-
-            # Clean up temp file
-            os.remove(temp_path)
+            # Run detection on the decoded pixels
+            detections = self._detect(image.np_bgr)
 
             # Unsafe content labels
             unsafe_labels = [
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import struct
+import time
+from typing import List, Optional, Union
+import numpy as np
+import logging
+
+from services.quantization import pack_int8, unpack_int8
+
+logger = logging.getLogger(__name__)
+
+try:
+    import lmdb
+except ImportError:  # The disk cache is optional; without it every miss hits the model
+    lmdb = None
+
+
+class EmbeddingDiskCache:
+    """
+    Persistent embedding cache shared by every worker on a host
+
+    An LMDB file maps sha256(namespace + text) to the int8-quantized embedding
+    (4x smaller than float32), so the cache survives restarts and deploys when
+    stored on a volume. A second database tracks last access times, and the
+    least recently used entries are evicted once max_entries is exceeded.
+
+    Calls block on disk and on the LMDB writer lock, so run them on an
+    executor rather than the event loop.
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.path = os.getenv("EMBEDDING_DISK_CACHE_DIR", "cache/embeddings")
+        self.max_entries = int(os.getenv("EMBEDDING_DISK_CACHE_MAX_ENTRIES", "100000"))
+        self.access_refresh = float(os.getenv("EMBEDDING_DISK_CACHE_ACCESS_REFRESH_SECONDS", "300"))
+        self._env = None
+
+        if lmdb is None:
+            logger.warning("lmdb not installed, embedding disk cache disabled")
+            return
+
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            self._env = lmdb.open(
+                self.path,
+                map_size=int(os.getenv("EMBEDDING_DISK_CACHE_MAP_SIZE", str(1 << 30))),
+                max_dbs=2
+            )
+            self._vectors = self._env.open_db(b"vectors")
+            self._access = self._env.open_db(b"access")
+            logger.info(f"Embedding disk cache at {self.path}")
+        except Exception as e:
+            logger.warning(f"Embedding disk cache disabled: {e}")
+            self._env = None
+
+    def _key(self, text: str) -> bytes:
+        # "int8" marks the value format so older float32 entries are never misread
+        return hashlib.sha256(f"{self.namespace}\0int8\0{text}".encode("utf-8")).digest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for text, or None on a miss"""
+        if self._env is None:
+            return None
+
+        key = self._key(text)
+        try:
+            # Read-only, so hits from every worker proceed without the writer lock
+            with self._env.begin() as txn:
+                raw = txn.get(key, db=self._vectors)
+                if raw is None:
+                    return None
+                accessed = txn.get(key, db=self._access)
+
+            # Eviction only needs a rough LRU order, so the access time is
+            # rewritten at most once per access_refresh seconds
+            now = time.time()
+            if accessed is None or struct.unpack("<d", accessed)[0] + self.access_refresh <= now:
+                with self._env.begin(write=True) as txn:
+                    txn.put(key, struct.pack("<d", now), db=self._access)
+            return unpack_int8(raw)
+        except lmdb.Error as e:
+            logger.warning(f"Embedding disk cache read failed: {e}")
+            return None
+
+    def put(self, text: str, embedding: Union[List[float], np.ndarray]):
+        """Store an embedding, evicting the oldest entries if over capacity"""
+        if self._env is None:
+            return
+
+        key = self._key(text)
+        try:
+            with self._env.begin(write=True) as txn:
+                txn.put(key, pack_int8(embedding), db=self._vectors)
+                txn.put(key, struct.pack("<d", time.time()), db=self._access)
+
+                if txn.stat(self._vectors)["entries"] > self.max_entries:
+                    self._evict(txn)
+        except lmdb.Error as e:
+            logger.warning(f"Embedding disk cache write failed: {e}")
+
+    def _evict(self, txn):
+        """Drop the least recently used 10% so eviction doesn't run on every put"""
+        with txn.cursor(db=self._access) as cursor:
+            entries = sorted((struct.unpack("<d", value)[0], key) for key, value in cursor)
+
+        target = int(self.max_entries * 0.9)
+        for _, key in entries[:len(entries) - target]:
+            txn.delete(key, db=self._vectors)
+            txn.delete(key, db=self._access)
+
+        logger.info(f"Evicted {max(0, len(entries) - target)} entries from embedding disk cache")
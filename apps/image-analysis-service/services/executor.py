@@ -0,0 +1,14 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+# Shared pool for CPU-bound PIL/ONNX work, so it never runs on the event loop
+EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="cpu")
+
+
+async def run_cpu_bound(func: Callable[..., T], *args) -> T:
+    """Run func(*args) on the shared CPU pool and await the result"""
+    return await asyncio.get_running_loop().run_in_executor(EXECUTOR, func, *args)
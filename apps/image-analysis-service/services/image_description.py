@@ -1,17 +1,45 @@
-import io
+import asyncio
 import os
-import base64
-import requests
-from typing import Optional
-from PIL import Image
+import pybase64
+import httpx
+import orjson
+from typing import List, Optional
 import logging
 
+from services.batching import BatchQueue
+from services.executor import run_cpu_bound
+from services.preprocess import PreparedImage, prepare
+from services.trt_llava import TRTLlavaClient
+
 logger = logging.getLogger(__name__)
 
+# generate_description reports failures in-band; these prefixes mark them
+ERROR_PREFIXES = (
+    "Image description unavailable",
+    "Unknown image description provider",
+    "Error ",
+    "Failed to generate",
+)
+
+PROMPT = """Describe this image in detail for search indexing purposes.
+Include: objects, people, actions, setting, colors, text visible, and overall theme.
+Keep it concise but comprehensive (2-3 sentences)."""
+
+# OpenAI caches identical prompt prefixes, so single and batched requests share
+# this system message verbatim and only the images differ
+OPENAI_SYSTEM_PROMPT = PROMPT + """
+You may be given several images. Respond with a JSON object {"descriptions": [...]}
+holding one description string per image, in the order the images are given."""
+
+OPENAI_MAX_TOKENS_PER_IMAGE = 150
+
 
 class ImageDescriptionService:
     """
     Generate image descriptions using Ollama + LLaVA (local) or OpenAI Vision API (cloud)
+
+    With provider "ollama", a TensorRT-LLM LLaVA engine (LLAVA_TRT_ENGINE_DIR)
+    is used in-process instead of Ollama when one is available for the GPU.
     """
 
     def __init__(self):
@@ -21,14 +49,43 @@ class ImageDescriptionService:
         # Ollama settings
         self.ollama_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         self.ollama_model = "llava"
+        # Token budget for the 2-3 sentence description; generation stops there
+        self.ollama_max_tokens = int(os.getenv("OLLAMA_MAX_TOKENS", "120"))
+        self.ollama_keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+        self.trt_llava = TRTLlavaClient.from_env(self.ollama_max_tokens) if self.provider == "ollama" else None
 
         # OpenAI settings
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.openai_model = os.getenv("OPENAI_VISION_MODEL", "gpt-4o-mini")
 
-        self._is_available = self._check_availability()
-
-    def _check_availability(self) -> bool:
+        # Requests arriving together are described as one batch
+        self._batch_queue = BatchQueue(
+            self._describe_batch,
+            maxsize=int(os.getenv("DESCRIPTION_BATCH_SIZE", "8")),
+            wait_ms=int(os.getenv("DESCRIPTION_BATCH_WAIT_MS", "25"))
+        )
+        # Shared async client keeps connections to the provider alive between calls
+        self._http = httpx.AsyncClient(
+            timeout=30,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            http2=True
+        )
+
+        # Availability is checked lazily on first use, then memoized
+        self._is_available = False
+        self._availability_checked = asyncio.Event()
+        self._availability_lock = asyncio.Lock()
+
+    @property
+    def cache_id(self) -> str:
+        """Identifies the provider and model behind a description, for result cache keys"""
+        if self.provider == "openai":
+            return f"openai:{self.openai_model}"
+        if self.trt_llava:
+            return f"trt-llava:{self.trt_llava.engine_dir}"
+        return f"{self.provider}:{self.ollama_model}"
+
+    async def _check_availability(self) -> bool:
         """Check if the selected image description provider is available"""
         try:
             if self.provider == "openai":
@@ -40,9 +97,13 @@ class ImageDescriptionService:
                     return False
 
             elif self.provider == "ollama":
-                response = requests.get(f"{self.ollama_url}/api/tags", timeout=2)
+                if self.trt_llava:
+                    logger.info("Using in-process TensorRT LLaVA engine")
+                    return True
+
+                response = await self._http.get(f"{self.ollama_url}/api/tags", timeout=2)
                 if response.status_code == 200:
-                    models = response.json().get("models", [])
+                    models = orjson.loads(response.content).get("models", [])
                     # Check if llava model is available
                     has_llava = any(self.ollama_model in m.get("name", "") for m in models)
                     if has_llava:
@@ -60,10 +121,24 @@ class ImageDescriptionService:
             logger.warning(f"Image description service not available: {e}")
             return False
 
-    def is_available(self) -> bool:
+    async def is_available(self) -> bool:
         """Check if service is available"""
+        if not self._availability_checked.is_set():
+            async with self._availability_lock:
+                if not self._availability_checked.is_set():
+                    self._is_available = await self._check_availability()
+                    self._availability_checked.set()
         return self._is_available
 
+    async def aclose(self):
+        """Close the shared HTTP client"""
+        await self._http.aclose()
+
+    @staticmethod
+    def is_error(description: Optional[str]) -> bool:
+        """Check if a description is actually a failure message"""
+        return not description or description.startswith(ERROR_PREFIXES)
+
     async def generate_description(self, image_bytes: bytes) -> str:
         """
         Generate a detailed description of the image for search indexing
@@ -71,146 +146,163 @@ class ImageDescriptionService:
         Args:
             image_bytes: Image file as bytes
 
+        Returns:
+            str: Detailed image description
+        """
+        return await self.describe_prepared(prepare(image_bytes))
+
+    async def describe_prepared(self, image: PreparedImage) -> str:
+        """
+        Generate a detailed description of a prepared image
+
+        Args:
+            image: Image from services.preprocess.prepare
+
         Returns:
             str: Detailed image description
         """
         try:
-            if not self._is_available:
+            if not await self.is_available():
                 return f"Image description unavailable - {self.provider} service not configured"
 
-            if self.provider == "openai":
-                return await self._generate_with_openai(image_bytes)
-            elif self.provider == "ollama":
-                return await self._generate_with_ollama(image_bytes)
-            else:
+            if self.provider not in ("openai", "ollama"):
                 return "Unknown image description provider"
 
+            return await self._batch_queue.submit(image)
+
         except Exception as e:
             logger.error(f"Image description error: {e}")
             return f"Error generating description: {str(e)}"
 
-    async def _generate_with_openai(self, image_bytes: bytes) -> str:
-        """Generate description using OpenAI Vision API"""
-        try:
-            # Prepare image
-            image = Image.open(io.BytesIO(image_bytes))
-
-            # Convert RGBA to RGB if needed
-            if image.mode == 'RGBA':
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[3])
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
-
-            # Resize if too large
-            max_size = 1024  # OpenAI supports larger images
-            if max(image.size) > max_size:
-                ratio = max_size / max(image.size)
-                new_size = tuple(int(dim * ratio) for dim in image.size)
-                image = image.resize(new_size, Image.Resampling.LANCZOS)
-
-            # Convert to base64
-            buffer = io.BytesIO()
-            image.save(buffer, format="JPEG", quality=85)
-            image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-
-            # Call OpenAI API
-            prompt = """Describe this image in detail for search indexing purposes.
-Include: objects, people, actions, setting, colors, text visible, and overall theme.
-Keep it concise but comprehensive (2-3 sentences)."""
+    async def _describe_batch(self, images: List[PreparedImage]) -> List[str]:
+        """Describe a batch of images with the configured provider"""
+        if self.provider == "openai":
+            descriptions = await self._generate_with_openai(images)
+            if descriptions is not None:
+                return descriptions
+            if len(images) == 1:
+                return ["Failed to generate image description"]
+
+            logger.warning("OpenAI batch failed, retrying images individually")
+            results = await asyncio.gather(*(self._generate_with_openai([image]) for image in images))
+            return [r[0] if r else "Failed to generate image description" for r in results]
+
+        generate = self._generate_with_trt_llava if self.trt_llava else self._generate_with_ollama
+        return list(await asyncio.gather(*(generate(image) for image in images)))
 
-            response = requests.post(
+    async def _generate_with_openai(self, images: List[PreparedImage]) -> Optional[List[str]]:
+        """
+        Generate descriptions for one or more images in a single OpenAI request
+
+        Returns None if the request fails or the answer doesn't contain one
+        description per image.
+        """
+        try:
+            content = [{"type": "text", "text": f"{len(images)} image(s):"}]
+            for image in images:
+                # OpenAI supports larger images
+                image_base64 = await run_cpu_bound(lambda: pybase64.b64encode_as_string(image.jpeg_large))
+                content.append({
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
+                })
+
+            response = await self._http.post(
                 "https://api.openai.com/v1/chat/completions",
                 headers={
                     "Authorization": f"Bearer {self.openai_api_key}",
                     "Content-Type": "application/json"
                 },
-                json={
+                content=orjson.dumps({
                     "model": self.openai_model,
                     "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{image_base64}"
-                                    }
-                                }
-                            ]
-                        }
+                        {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
+                        {"role": "user", "content": content}
                     ],
-                    "max_tokens": 300
-                },
-                timeout=30
+                    "response_format": {"type": "json_object"},
+                    "max_tokens": OPENAI_MAX_TOKENS_PER_IMAGE * len(images)
+                })
             )
 
-            if response.status_code == 200:
-                result = response.json()
-                description = result["choices"][0]["message"]["content"].strip()
-                logger.info(f"Generated description (OpenAI): {description[:100]}...")
-                return description
-            else:
+            if response.status_code != 200:
                 logger.error(f"OpenAI API error: {response.status_code} - {response.text}")
-                return "Failed to generate image description"
+                return None
+
+            message = orjson.loads(response.content)["choices"][0]["message"]["content"]
+            descriptions = orjson.loads(message).get("descriptions")
+            if not isinstance(descriptions, list) or len(descriptions) != len(images):
+                logger.warning("OpenAI answer didn't contain one description per image")
+                return None
+
+            descriptions = [str(d).strip() for d in descriptions]
+            logger.info(f"Generated {len(descriptions)} description(s) (OpenAI): {descriptions[0][:100]}...")
+            return descriptions
 
         except Exception as e:
             logger.error(f"OpenAI description error: {e}")
-            return f"Error with OpenAI: {str(e)}"
+            return None
 
-    async def _generate_with_ollama(self, image_bytes: bytes) -> str:
-        """Generate description using Ollama + LLaVA"""
+    async def _generate_with_trt_llava(self, image: PreparedImage) -> str:
+        """Generate description using the in-process TensorRT LLaVA engine"""
         try:
-            # Convert image to base64
-            image = Image.open(io.BytesIO(image_bytes))
-
-            # Convert RGBA to RGB if needed
-            if image.mode == 'RGBA':
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[3])
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
-
-            # Resize if too large (LLaVA works better with smaller images)
-            max_size = 512
-            if max(image.size) > max_size:
-                ratio = max_size / max(image.size)
-                new_size = tuple(int(dim * ratio) for dim in image.size)
-                image = image.resize(new_size, Image.Resampling.LANCZOS)
-
-            # Convert to base64
-            buffer = io.BytesIO()
-            image.save(buffer, format="JPEG", quality=85)
-            image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-
-            # Call Ollama API
-            prompt = """Describe this image in detail for search indexing purposes.
-Include: objects, people, actions, setting, colors, text visible, and overall theme.
-Keep it concise but comprehensive (2-3 sentences)."""
-
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": self.ollama_model,
-                    "prompt": prompt,
-                    "images": [image_base64],
-                    "stream": False
-                },
-                timeout=30
+            # rgb_pil is decoded lazily; read it on the worker, not the event loop
+            description = await asyncio.get_running_loop().run_in_executor(
+                self.trt_llava.executor,
+                lambda: self.trt_llava.generate(image.rgb_pil, PROMPT)
             )
+            logger.info(f"Generated description (TensorRT LLaVA): {description[:100]}...")
+            return description
 
-            if response.status_code == 200:
-                result = response.json()
-                description = result.get("response", "").strip()
+        except Exception as e:
+            logger.warning(f"TensorRT LLaVA description error, falling back to Ollama: {e}")
+            return await self._generate_with_ollama(image)
 
-                logger.info(f"Generated description (Ollama): {description[:100]}...")
-                return description
-            else:
-                logger.error(f"Ollama API error: {response.status_code}")
-                return "Failed to generate image description"
+    async def _generate_with_ollama(self, image: PreparedImage) -> str:
+        """Generate description using Ollama + LLaVA"""
+        try:
+            # LLaVA works better with smaller images
+            image_base64 = await run_cpu_bound(lambda: pybase64.b64encode_as_string(image.jpeg_small))
+
+            # Stream tokens so we can stop as soon as the description is complete.
+            # The constant system message lets Ollama reuse its prefix, and
+            # keep_alive keeps LLaVA loaded between requests.
+            chunks = []
+            async with self._http.stream(
+                "POST",
+                f"{self.ollama_url}/api/chat",
+                headers={"Content-Type": "application/json"},
+                content=orjson.dumps({
+                    "model": self.ollama_model,
+                    "messages": [
+                        {"role": "system", "content": PROMPT},
+                        {"role": "user", "content": "Describe this image.", "images": [image_base64]}
+                    ],
+                    "stream": True,
+                    "keep_alive": self.ollama_keep_alive,
+                    "options": {
+                        "num_predict": self.ollama_max_tokens,
+                        "stop": ["\n\n"]
+                    }
+                })
+            ) as response:
+                if response.status_code != 200:
+                    logger.error(f"Ollama API error: {response.status_code}")
+                    return "Failed to generate image description"
+
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = orjson.loads(line)
+                    chunks.append(chunk.get("message", {}).get("content", ""))
+                    # Each streamed chunk is one token; closing the stream early
+                    # makes Ollama stop generating
+                    if chunk.get("done") or len(chunks) >= self.ollama_max_tokens:
+                        break
+
+            description = "".join(chunks).strip()
+
+            logger.info(f"Generated description (Ollama): {description[:100]}...")
+            return description
 
         except Exception as e:
             logger.error(f"Ollama description error: {e}")
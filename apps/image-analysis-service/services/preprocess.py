@@ -0,0 +1,163 @@
+import hashlib
+import io
+from typing import Optional
+import numpy as np
+from PIL import Image
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    # libvips resizes with shrink-on-load and SIMD kernels; Pillow is the fallback
+    import pyvips
+except (ImportError, OSError):
+    pyvips = None
+
+# Largest side of the JPEG sent to each description provider
+SMALL_SIZE = 512  # LLaVA works better with smaller images
+LARGE_SIZE = 1024  # OpenAI supports larger images
+JPEG_QUALITY = 85
+VIPS_JPEG_FORMAT = f".jpg[Q={JPEG_QUALITY},optimize_coding]"
+
+
+class _lazy:
+    """
+    Compute an attribute on first access and store it on the instance
+
+    Unlike functools.cached_property before Python 3.12, there is no lock
+    shared by all instances, so different uploads decode in parallel. Two
+    threads racing on the same instance may both compute the value; the
+    results are identical.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = self.func(instance)
+        # Instance attributes shadow this (non-data) descriptor from now on
+        instance.__dict__[self.name] = value
+        return value
+
+
+class PreparedImage:
+    """
+    An uploaded image decoded once and shared by moderation and description
+
+    Each derived form (RGB image, BGR array, provider-sized JPEGs) is computed
+    on first access and reused afterwards, so an endpoint only pays for the
+    forms it actually needs.
+    """
+
+    def __init__(self, image_bytes: bytes, sha256: Optional[bytes] = None):
+        self.image_bytes = image_bytes
+        if sha256 is not None:
+            self.sha256 = sha256
+
+    @_lazy
+    def sha256(self) -> bytes:
+        return hashlib.sha256(self.image_bytes).digest()
+
+    @_lazy
+    def rgb_pil(self) -> Image.Image:
+        """Decoded image as RGB, with transparency composited onto white"""
+        image = Image.open(io.BytesIO(self.image_bytes))
+
+        # Convert RGBA to RGB if needed
+        if image.mode == 'RGBA':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[3])  # 3 is the alpha channel
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        return image
+
+    @_lazy
+    def np_bgr(self) -> np.ndarray:
+        """Full-size pixels in BGR order (what cv2/NudeNet expect)"""
+        if pyvips is not None:
+            try:
+                image = _vips_rgb(pyvips.Image.new_from_buffer(self.image_bytes, "", access="sequential"))
+                pixels = np.ndarray(
+                    buffer=image.write_to_memory(),
+                    dtype=np.uint8,
+                    shape=[image.height, image.width, image.bands]
+                )
+                return np.ascontiguousarray(pixels[:, :, ::-1])
+            except pyvips.Error as e:
+                logger.debug(f"libvips decode failed, using Pillow: {e}")
+
+        # Reuse the RGB decode rather than decoding the upload a second time
+        return np.ascontiguousarray(np.asarray(self.rgb_pil)[:, :, ::-1])
+
+    @_lazy
+    def jpeg_large(self) -> bytes:
+        if self._vips_large is not None:
+            return self._vips_large.write_to_buffer(VIPS_JPEG_FORMAT)
+        return _encode_jpeg(self._resized_large)
+
+    @_lazy
+    def jpeg_small(self) -> bytes:
+        # Downscale from the already-reduced large variant, not the original
+        if self._vips_large is not None:
+            return self._vips_large.thumbnail_image(SMALL_SIZE, size="down").write_to_buffer(VIPS_JPEG_FORMAT)
+        return _encode_jpeg(_fit(self._resized_large, SMALL_SIZE))
+
+    @_lazy
+    def _resized_large(self) -> Image.Image:
+        return _fit(self.rgb_pil, LARGE_SIZE)
+
+    @_lazy
+    def _vips_large(self) -> Optional["pyvips.Image"]:
+        """LARGE_SIZE thumbnail rendered by libvips, or None to use Pillow"""
+        if pyvips is None:
+            return None
+        try:
+            image = pyvips.Image.thumbnail_buffer(self.image_bytes, LARGE_SIZE, size="down")
+            return _vips_rgb(image).copy_memory()
+        except pyvips.Error as e:
+            logger.debug(f"libvips thumbnail failed, using Pillow: {e}")
+            return None
+
+
+def prepare(image_bytes: bytes, sha256: Optional[bytes] = None) -> PreparedImage:
+    """
+    Wrap uploaded bytes for shared preprocessing
+
+    Args:
+        image_bytes: Image file as bytes
+        sha256: Digest of image_bytes, if the caller already computed it
+
+    Returns:
+        PreparedImage
+    """
+    return PreparedImage(image_bytes, sha256)
+
+
+def _fit(image: Image.Image, max_size: int) -> Image.Image:
+    """Resize so the longest side is at most max_size"""
+    if max(image.size) <= max_size:
+        return image
+    ratio = max_size / max(image.size)
+    new_size = tuple(int(dim * ratio) for dim in image.size)
+    return image.resize(new_size, Image.Resampling.LANCZOS)
+
+
+def _vips_rgb(image: "pyvips.Image") -> "pyvips.Image":
+    """8-bit sRGB with transparency composited onto white, like rgb_pil"""
+    if image.hasalpha():
+        image = image.flatten(background=[255, 255, 255])
+    if image.interpretation != "srgb":
+        image = image.colourspace("srgb")
+    return image
+
+
+def _encode_jpeg(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=JPEG_QUALITY)
+    return buffer.getvalue()
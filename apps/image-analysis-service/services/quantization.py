@@ -0,0 +1,36 @@
+from typing import List, Tuple, Union
+import numpy as np
+
+
+def quantize_int8(vector: Union[List[float], np.ndarray]) -> Tuple[np.ndarray, float]:
+    """
+    Symmetric per-vector int8 quantization
+
+    Args:
+        vector: Embedding as floats
+
+    Returns:
+        (int8 array, scale) such that vector ≈ q * scale
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    peak = float(np.max(np.abs(vector))) if vector.size else 0.0
+    scale = peak / 127 if peak > 0 else 1.0
+    q = np.clip(np.round(vector / scale), -127, 127).astype(np.int8)
+    return q, scale
+
+
+def dequantize_int8(q: np.ndarray, scale: float) -> np.ndarray:
+    """Reconstruct a float32 vector from quantize_int8 output"""
+    return q.astype(np.float32) * np.float32(scale)
+
+
+def pack_int8(vector: Union[List[float], np.ndarray]) -> bytes:
+    """Quantize and serialize as float32 scale followed by int8 values"""
+    q, scale = quantize_int8(vector)
+    return np.float32(scale).tobytes() + q.tobytes()
+
+
+def unpack_int8(raw: bytes) -> np.ndarray:
+    """Inverse of pack_int8"""
+    scale = float(np.frombuffer(raw[:4], dtype=np.float32)[0])
+    return dequantize_int8(np.frombuffer(raw[4:], dtype=np.int8), scale)
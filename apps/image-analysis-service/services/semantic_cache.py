@@ -0,0 +1,265 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Union
+import numpy as np
+import orjson
+import logging
+
+from services.executor import run_cpu_bound
+
+logger = logging.getLogger(__name__)
+
+try:
+    import sqlite_vec
+except ImportError:  # Optional; without it each worker keeps its own in-memory cache
+    sqlite_vec = None
+
+
+class SemanticCache:
+    """
+    Cache of recent search results keyed by query embedding
+
+    A new query is a hit if its cosine similarity to a cached query reaches
+    SEMANTIC_CACHE_THRESHOLD, so rephrasings skip the Qdrant round-trip.
+    Entries live in fixed rows of one normalized matrix, so a lookup is a
+    single matrix-vector product.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.max_entries = int(os.getenv("SEMANTIC_CACHE_SIZE", "256"))
+        self.threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+        self.ttl = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "300"))
+        self._vectors = np.zeros((self.max_entries, dim), dtype=np.float32)
+        # row -> (expires_at, limit, results), oldest first
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._free = list(range(self.max_entries))
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        q = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        return q / norm if norm else q
+
+    async def get(self, embedding: Sequence[float], limit: int) -> Optional[List[Dict]]:
+        """
+        Return cached results for a similar query, or None on a miss
+
+        Args:
+            embedding: Query embedding
+            limit: Number of results wanted; entries cached with a smaller limit don't match
+        """
+        if not self._entries:
+            self.misses += 1
+            return None
+
+        # Unused rows are zero, so they never reach the threshold
+        scores = self._vectors @ self._normalize(embedding)
+        row = int(scores.argmax())
+        entry = self._entries.get(row)
+        if entry is None or scores[row] < self.threshold:
+            self.misses += 1
+            return None
+
+        expires_at, cached_limit, results = entry
+        if expires_at <= time.monotonic():
+            self._evict(row)
+            self.misses += 1
+            return None
+        if cached_limit < limit:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(row)
+        self.hits += 1
+        return results[:limit]
+
+    async def put(self, embedding: Sequence[float], limit: int, results: List[Dict]):
+        """Cache the results of a query, evicting the least recently used entry when full"""
+        if self.max_entries <= 0:
+            return
+        if not self._free:
+            self._evict(next(iter(self._entries)))
+        row = self._free.pop()
+        self._vectors[row] = self._normalize(embedding)
+        self._entries[row] = (time.monotonic() + self.ttl, limit, results)
+
+    async def clear(self):
+        """Drop every entry; called when the index changes"""
+        self._entries.clear()
+        self._vectors[:] = 0
+        self._free = list(range(self.max_entries))
+
+    def _evict(self, row: int):
+        del self._entries[row]
+        self._vectors[row] = 0
+        self._free.append(row)
+
+    async def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "max_size": self.max_entries,
+            "threshold": self.threshold,
+            "shared": False,
+        }
+
+
+class SqliteSemanticCache:
+    """
+    Semantic search cache in a sqlite-vec database shared by every worker
+
+    Same interface and matching rules as SemanticCache, but entries live in a
+    vec0 table on disk (SEMANTIC_CACHE_PATH), so all workers share hits and
+    invalidations, and the cache survives restarts. Queries run on the shared
+    CPU pool, each thread with its own connection, so disk I/O and waits on
+    other workers' write locks never block the event loop.
+    """
+
+    def __init__(self, path: str, dim: int = 512):
+        self.path = path
+        self.max_entries = int(os.getenv("SEMANTIC_CACHE_SIZE", "256"))
+        self.threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+        self.ttl = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "300"))
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._connection()
+        # Several workers write concurrently
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS cache_vec USING vec0(embedding float[{dim}] distance_metric=cosine)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_meta ("
+            "rowid INTEGER PRIMARY KEY, result_limit INTEGER, results_json BLOB, created_at REAL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's connection, opened on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.enable_load_extension(True)
+            sqlite_vec.load(conn)
+            conn.enable_load_extension(False)
+            conn.execute("PRAGMA busy_timeout=5000")
+            # WAL stays consistent without an fsync on every commit
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _blob(embedding: Sequence[float]) -> bytes:
+        return np.asarray(embedding, dtype=np.float32).tobytes()
+
+    async def get(self, embedding: Sequence[float], limit: int) -> Optional[List[Dict]]:
+        """Return cached results for a similar query, or None on a miss"""
+        return await run_cpu_bound(self._get, embedding, limit)
+
+    async def put(self, embedding: Sequence[float], limit: int, results: List[Dict]):
+        """Cache the results of a query, dropping expired and oldest entries beyond the size cap"""
+        if self.max_entries > 0:
+            await run_cpu_bound(self._put, embedding, limit, results)
+
+    async def clear(self):
+        """Drop every entry, for all workers; called when the index changes"""
+        await run_cpu_bound(self._clear)
+
+    def _get(self, embedding: Sequence[float], limit: int) -> Optional[List[Dict]]:
+        try:
+            row = self._connection().execute(
+                "SELECT m.result_limit, m.results_json, m.created_at, v.distance "
+                "FROM (SELECT rowid, distance FROM cache_vec WHERE embedding MATCH ? AND k = 1) v "
+                "JOIN cache_meta m ON m.rowid = v.rowid",
+                (self._blob(embedding),)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Semantic cache read failed: {e}")
+            row = None
+
+        # Cosine distance is 1 - similarity
+        if (
+            row is None
+            or 1 - row[3] < self.threshold
+            or row[2] + self.ttl <= time.time()
+            or row[0] < limit
+        ):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return orjson.loads(row[1])[:limit]
+
+    def _put(self, embedding: Sequence[float], limit: int, results: List[Dict]):
+        conn = self._connection()
+        now = time.time()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                cursor = conn.execute(
+                    "INSERT INTO cache_meta (result_limit, results_json, created_at) VALUES (?, ?, ?)",
+                    (limit, orjson.dumps(results), now)
+                )
+                conn.execute(
+                    "INSERT INTO cache_vec (rowid, embedding) VALUES (?, ?)",
+                    (cursor.lastrowid, self._blob(embedding))
+                )
+                self._delete(
+                    conn,
+                    "SELECT rowid FROM cache_meta WHERE created_at <= ? "
+                    "OR rowid NOT IN (SELECT rowid FROM cache_meta ORDER BY rowid DESC LIMIT ?)",
+                    (now - self.ttl, self.max_entries)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Semantic cache write failed: {e}")
+
+    def _clear(self):
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM cache_vec")
+                conn.execute("DELETE FROM cache_meta")
+        except sqlite3.Error as e:
+            logger.warning(f"Semantic cache clear failed: {e}")
+
+    def _size(self) -> int:
+        return self._connection().execute("SELECT count(*) FROM cache_meta").fetchone()[0]
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, rowid_query: str, params: tuple):
+        rowids = [(rowid,) for rowid, in conn.execute(rowid_query, params)]
+        conn.executemany("DELETE FROM cache_vec WHERE rowid = ?", rowids)
+        conn.executemany("DELETE FROM cache_meta WHERE rowid = ?", rowids)
+
+    async def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": await run_cpu_bound(self._size),
+            "max_size": self.max_entries,
+            "threshold": self.threshold,
+            "shared": True,
+        }
+
+
+def create_semantic_cache(dim: int = 512) -> Union[SemanticCache, SqliteSemanticCache]:
+    """The shared sqlite-vec cache if it can be opened, else the in-process one"""
+    path = os.getenv("SEMANTIC_CACHE_PATH", "cache/semantic_cache.db")
+    if path and sqlite_vec is not None:
+        try:
+            cache = SqliteSemanticCache(path, dim=dim)
+            logger.info(f"Semantic cache at {path}")
+            return cache
+        except (sqlite3.Error, AttributeError, OSError) as e:
+            # AttributeError: Python built without SQLite extension loading
+            logger.warning(f"Shared semantic cache unavailable ({e}), using in-process cache")
+    return SemanticCache(dim=dim)
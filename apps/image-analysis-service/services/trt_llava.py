@@ -0,0 +1,128 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Optional
+from PIL import Image
+import logging
+
+logger = logging.getLogger(__name__)
+
+# MultimodalModelRunner's constructor arguments and run() signature change
+# between releases; this is the one the runner args below are written for
+TENSORRT_LLM_VERSION = "0.12.0"
+
+try:
+    # Only present on GPU hosts with TensorRT-LLM installed
+    import tensorrt_llm
+    import torch
+    from tensorrt_llm.runtime import MultimodalModelRunner
+except ImportError:
+    tensorrt_llm = None
+    torch = None
+    MultimodalModelRunner = None
+
+
+class _RunnerArgs(SimpleNamespace):
+    """CLI-style args for MultimodalModelRunner, as examples/multimodal/run.py would parse them"""
+
+    def __getattr__(self, name):
+        # Fail loudly instead of letting the runner pick up None for a required setting
+        raise AttributeError(
+            f"MultimodalModelRunner option {name!r} is not set "
+            f"(written for tensorrt_llm=={TENSORRT_LLM_VERSION})"
+        )
+
+
+class TRTLlavaClient:
+    """
+    LLaVA compiled with TensorRT-LLM and run in-process on the GPU
+
+    Engines are looked up under LLAVA_TRT_ENGINE_DIR/sm_<XY>/ for the current
+    GPU's compute capability, with the vision encoder in vision/ and the
+    language model in llm/. Use from_env(), which returns None whenever the
+    engines can't be used so the caller can fall back to Ollama.
+    """
+
+    def __init__(self, engine_dir: str, hf_model_dir: str, max_new_tokens: int):
+        self.engine_dir = engine_dir
+        self.max_new_tokens = max_new_tokens
+        self.runner = MultimodalModelRunner(_RunnerArgs(
+            visual_engine_dir=os.path.join(engine_dir, "vision"),
+            visual_engine_name="model.engine",
+            llm_engine_dir=os.path.join(engine_dir, "llm"),
+            hf_model_dir=hf_model_dir,
+            max_new_tokens=max_new_tokens,
+            batch_size=1,
+            num_beams=1,
+            top_k=1,
+            top_p=0.0,
+            temperature=1.0,
+            repetition_penalty=1.0,
+            kv_cache_free_gpu_memory_fraction=0.7,
+            log_level="warning",
+            # run.py defaults for the remaining options
+            input_text=None,
+            image_path=None,
+            video_path=None,
+            path_sep=",",
+            lora_task_uids=None,
+            enable_context_fmha_fp32_acc=None,
+            run_profiling=False,
+            profiling_iterations=20,
+            check_accuracy=False
+        ))
+        # One GPU, one generation at a time
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trt-llava")
+
+    @classmethod
+    def from_env(cls, max_new_tokens: int) -> Optional["TRTLlavaClient"]:
+        """Load the engine for this GPU if LLAVA_TRT_ENGINE_DIR is configured"""
+        engine_root = os.getenv("LLAVA_TRT_ENGINE_DIR")
+        if not engine_root:
+            return None
+
+        if MultimodalModelRunner is None:
+            logger.warning("LLAVA_TRT_ENGINE_DIR set but tensorrt_llm is not installed, using Ollama")
+            return None
+        if tensorrt_llm.__version__ != TENSORRT_LLM_VERSION:
+            logger.warning(
+                f"tensorrt_llm {tensorrt_llm.__version__} installed but {TENSORRT_LLM_VERSION} "
+                "is required, using Ollama"
+            )
+            return None
+        if not torch.cuda.is_available():
+            logger.warning("LLAVA_TRT_ENGINE_DIR set but no CUDA device found, using Ollama")
+            return None
+
+        # Engines are specific to the GPU architecture they were built on
+        major, minor = torch.cuda.get_device_capability()
+        engine_dir = os.path.join(engine_root, f"sm_{major}{minor}")
+        if not os.path.isdir(os.path.join(engine_dir, "llm")):
+            logger.warning(f"No TensorRT LLaVA engine at {engine_dir}, using Ollama")
+            return None
+
+        try:
+            client = cls(
+                engine_dir,
+                hf_model_dir=os.getenv("LLAVA_HF_MODEL_DIR", "llava-hf/llava-1.5-7b-hf"),
+                max_new_tokens=max_new_tokens
+            )
+            logger.info(f"TensorRT LLaVA engine loaded from {engine_dir}")
+            return client
+        except Exception as e:
+            logger.warning(f"Failed to load TensorRT LLaVA engine, using Ollama: {e}")
+            return None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        return self._executor
+
+    def generate(self, image: Image.Image, prompt: str) -> str:
+        """Describe an image; blocking, run it on self.executor"""
+        _, output_text = self.runner.run(
+            input_text=prompt,
+            input_image=image,
+            max_new_tokens=self.max_new_tokens
+        )
+        # output_text is [batch][beam]
+        return output_text[0][0].strip()
@@ -1,13 +1,62 @@
+import asyncio
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
+import grpc
+import httpx
+import torch
 from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http.exceptions import UnexpectedResponse
+from qdrant_client.models import (
+    Distance, VectorParams, HnswConfigDiff, PointStruct, PointsList, UpsertOperation, DeleteOperation,
+    FilterSelector, Filter, FieldCondition, MatchAny, MatchValue, HasIdCondition,
+    PayloadSchemaType, ScalarQuantization, ScalarQuantizationConfig, ScalarType, SearchParams, QuantizationSearchParams
+)
 import logging
 import uuid
+import numpy as np
+import onnxruntime as ort
+from services.batching import BatchQueue
+from services.clip_onnx import FP16_MODEL_FILE, MODEL_FILE, ONNXTextEncoder
+from services.semantic_cache import create_semantic_cache
 
 logger = logging.getLogger(__name__)
 
+# int8 copies of the vectors stay in RAM for the HNSW traversal (a quarter of
+# the float32 size); the top candidates are rescored with the original vectors
+QUANTIZATION_CONFIG = ScalarQuantization(
+    scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+)
+QUANTIZATION_SEARCH_PARAMS = QuantizationSearchParams(rescore=True, oversampling=2.0)
+
+# Payload fields that filters match on
+INDEXED_FIELDS = ["asset_id", "workspace"]
+
+# Only the fields search results are built from are sent back by Qdrant
+RESULT_FIELDS = ["asset_id", "description", "workspace", "name"]
+
+
+def _unit_vectors(embeddings: List[np.ndarray]) -> np.ndarray:
+    """Stack embeddings and scale each to length 1 (the collection scores by dot product)"""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+
+
+def _point_id(asset_id: str) -> str:
+    """Qdrant point ID for an asset; deterministic, so re-indexing overwrites in place"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, asset_id))
+
+
+def _already_exists(error: Exception) -> bool:
+    """True if Qdrant rejected a create because the target exists (REST 409 / gRPC ALREADY_EXISTS)"""
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code == 409
+    if isinstance(error, grpc.RpcError):
+        return error.code() == grpc.StatusCode.ALREADY_EXISTS
+    return False
+
 
 class VectorSearchService:
     """
@@ -20,160 +69,374 @@ class VectorSearchService:
         self.qdrant_api_key = os.getenv("QDRANT_API_KEY")  # For Qdrant Cloud
         self.qdrant_host = os.getenv("QDRANT_HOST", "localhost")  # For local
         self.qdrant_port = int(os.getenv("QDRANT_PORT", "6333"))  # For local
+        self.qdrant_grpc_port = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+        # gRPC (protobuf over HTTP/2) is cheaper per call than REST/JSON
+        self.prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", "1") == "1"
+        # Connection pool sized for concurrent requests; connections are reused between calls
+        self.qdrant_max_connections = int(os.getenv("QDRANT_MAX_CONN", "64"))
+        self.qdrant_max_keepalive = int(os.getenv("QDRANT_MAX_KEEPALIVE", "32"))
         self.collection_name = "asset_images"
-        self.embedding_model = None
+        # HNSW graph shape (applies when the collection is created): higher m and
+        # ef_construct raise recall at the cost of memory and indexing time
+        self.hnsw_m = int(os.getenv("HNSW_M", "16"))
+        self.hnsw_ef_construct = int(os.getenv("HNSW_EF_CONSTRUCT", "128"))
+        # Search beam width; unset scales it with the requested limit
+        hnsw_ef = os.getenv("HNSW_EF")
+        self.hnsw_ef = int(hnsw_ef) if hnsw_ef else None
+        self.model_name = "clip-ViT-B-32"
+        self._embedding_model = None
+        self._model_lock = threading.Lock()
         self.qdrant_client = None
+        self.semantic_cache = create_semantic_cache(dim=512)
+        # One thread so CLIP forward passes run one at a time, off the event loop
+        self._encoder_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip")
+        # Concurrent queries share one CLIP forward pass
+        self._encode_queue = BatchQueue(
+            self._encode_batch,
+            maxsize=int(os.getenv("CLIP_BATCH_SIZE", "32")),
+            wait_ms=int(os.getenv("CLIP_BATCH_WAIT_MS", "5"))
+        )
+        # Single index_asset calls are coalesced into multi-point upserts
+        self._index_queue = BatchQueue(
+            self.index_assets_batch,
+            maxsize=int(os.getenv("INDEX_BATCH_SIZE", "256")),
+            wait_ms=int(os.getenv("INDEX_BATCH_WAIT_MS", "50"))
+        )
         self._is_available = False
 
         self._initialize()
 
     def _initialize(self):
-        """Initialize CLIP model and Qdrant client"""
+        """Initialize the Qdrant client (the collection is set up by ensure_collection)"""
         try:
-            # Initialize CLIP model for embeddings
-            logger.info("Loading CLIP model...")
-            self.embedding_model = SentenceTransformer('clip-ViT-B-32')
-            logger.info("CLIP model loaded successfully")
+            # Keep REST connections and the gRPC channel alive between requests
+            connection_options = {
+                "limits": httpx.Limits(
+                    max_connections=self.qdrant_max_connections,
+                    max_keepalive_connections=self.qdrant_max_keepalive
+                ),
+                "grpc_options": {
+                    "grpc.keepalive_time_ms": 30000,
+                    "grpc.keepalive_timeout_ms": 10000,
+                    "grpc.http2.max_pings_without_data": 0
+                }
+            }
 
             # Initialize Qdrant client (Cloud or Local)
             if self.qdrant_url:
                 # Use Qdrant Cloud
                 logger.info(f"Connecting to Qdrant Cloud at {self.qdrant_url}...")
-                self.qdrant_client = QdrantClient(
+                self.qdrant_client = AsyncQdrantClient(
                     url=self.qdrant_url,
                     api_key=self.qdrant_api_key,
-                    timeout=10
+                    https=True,
+                    grpc_port=self.qdrant_grpc_port,
+                    prefer_grpc=self.prefer_grpc,
+                    timeout=10,
+                    **connection_options
                 )
             else:
                 # Use local Qdrant
                 logger.info(f"Connecting to local Qdrant at {self.qdrant_host}:{self.qdrant_port}...")
-                self.qdrant_client = QdrantClient(
+                self.qdrant_client = AsyncQdrantClient(
                     host=self.qdrant_host,
                     port=self.qdrant_port,
-                    timeout=5
+                    grpc_port=self.qdrant_grpc_port,
+                    prefer_grpc=self.prefer_grpc,
+                    timeout=5,
+                    **connection_options
                 )
 
-            # Check if collection exists, create if not
-            try:
-                collections = self.qdrant_client.get_collections()
-                collection_exists = any(
-                    c.name == self.collection_name
-                    for c in collections.collections
+        except Exception as e:
+            logger.error(f"Failed to initialize vector search: {e}")
+            self._is_available = False
+
+    @property
+    def embedding_model(self):
+        """CLIP text encoder, loaded on first use; blocking, only touch it on the encoder thread"""
+        if self._embedding_model is None:
+            with self._model_lock:
+                if self._embedding_model is None:
+                    self._embedding_model = self._load_embedding_model()
+        return self._embedding_model
+
+    def _load_embedding_model(self):
+        logger.info("Loading CLIP model...")
+        # ONNX text towers produced offline by quantize_clip_text.py: FP16 for
+        # CUDA hosts, INT8 for CPU deployments
+        use_fp16 = os.getenv("CLIP_ONNX_FP16", "0") == "1"
+        use_int8 = os.getenv("CLIP_ONNX_INT8", "0") == "1"
+        onnx_dir = os.getenv("CLIP_ONNX_DIR", "models/clip-text-int8")
+        has_cuda = "CUDAExecutionProvider" in ort.get_available_providers()
+        if use_fp16 and has_cuda and os.path.exists(os.path.join(onnx_dir, FP16_MODEL_FILE)):
+            model = ONNXTextEncoder(
+                onnx_dir,
+                model_file=FP16_MODEL_FILE,
+                providers=[("CUDAExecutionProvider", {"device_id": 0}), "CPUExecutionProvider"]
+            )
+            logger.info(f"CLIP FP16 text encoder loaded from {onnx_dir} on CUDA")
+        elif use_int8 and os.path.exists(os.path.join(onnx_dir, MODEL_FILE)):
+            model = ONNXTextEncoder(onnx_dir)
+            logger.info(f"CLIP INT8 text encoder loaded from {onnx_dir}")
+        else:
+            if use_fp16:
+                logger.warning(f"FP16 CLIP model or CUDA provider not available ({onnx_dir}), using PyTorch CLIP")
+            elif use_int8:
+                logger.warning(f"INT8 CLIP model not found in {onnx_dir}, using FP32 CLIP")
+            if torch.cuda.is_available():
+                # FP16 halves VRAM and runs the text tower on tensor cores
+                model = SentenceTransformer(
+                    self.model_name,
+                    device="cuda",
+                    model_kwargs={"torch_dtype": torch.float16}
                 )
+            else:
+                model = SentenceTransformer(self.model_name, device="cpu")
+            logger.info(f"CLIP model loaded successfully on {model.device}")
+
+        # First forward pass pays for allocator and kernel setup; keep it off real requests
+        model.encode(["warmup"], convert_to_numpy=True)
+        return model
+
+    async def preload_model(self):
+        """Load and warm up CLIP in the background so the first query doesn't wait for it"""
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._encoder_pool, lambda: self.embedding_model)
+        except Exception as e:
+            logger.error(f"Failed to load CLIP model: {e}")
 
-                if not collection_exists:
-                    logger.info(f"Creating collection: {self.collection_name}")
-                    self.qdrant_client.create_collection(
+    async def ensure_collection(self):
+        """Create the collection if needed; call once at app startup"""
+        if not self.qdrant_client:
+            return
+
+        # Check if collection exists, create if not
+        try:
+            if not await self.qdrant_client.collection_exists(self.collection_name):
+                await self._create_collection()
+            else:
+                logger.info(f"Collection {self.collection_name} already exists")
+                info = await self.qdrant_client.get_collection(self.collection_name)
+                if info.config.quantization_config is None:
+                    # Collections created before quantization was enabled; Qdrant
+                    # builds the int8 vectors in the background
+                    logger.info(f"Enabling scalar quantization on {self.collection_name}")
+                    await self.qdrant_client.update_collection(
                         collection_name=self.collection_name,
-                        vectors_config=VectorParams(
-                            size=512,  # CLIP ViT-B/32 embedding size
-                            distance=Distance.COSINE
-                        )
+                        quantization_config=QUANTIZATION_CONFIG
                     )
-                    logger.info(f"Collection {self.collection_name} created")
-                else:
-                    logger.info(f"Collection {self.collection_name} already exists")
 
-                self._is_available = True
-                logger.info("Vector search service initialized successfully")
+            await self._ensure_payload_indexes()
 
-            except Exception as e:
-                logger.error(f"Qdrant collection error: {e}")
-                self._is_available = False
+            self._is_available = True
+            logger.info("Vector search service initialized successfully")
 
         except Exception as e:
-            logger.error(f"Failed to initialize vector search: {e}")
+            logger.error(f"Qdrant collection error: {e}")
             self._is_available = False
 
+    async def _create_collection(self):
+        logger.info(f"Creating collection: {self.collection_name}")
+        try:
+            await self.qdrant_client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=VectorParams(
+                    size=512,  # CLIP ViT-B/32 embedding size
+                    # Embeddings are unit length, so dot product equals cosine
+                    distance=Distance.DOT,
+                    on_disk=False
+                ),
+                hnsw_config=HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct),
+                quantization_config=QUANTIZATION_CONFIG
+            )
+            logger.info(f"Collection {self.collection_name} created")
+        except (UnexpectedResponse, grpc.RpcError) as e:
+            # Workers start together; all but one lose the race to create it
+            if not _already_exists(e):
+                raise
+            logger.info(f"Collection {self.collection_name} created by another worker")
+
+    async def _ensure_payload_indexes(self):
+        """Keyword-index the filterable payload fields so filters skip segment scans"""
+        for field_name in INDEXED_FIELDS:
+            try:
+                await self.qdrant_client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=PayloadSchemaType.KEYWORD
+                )
+            except Exception as e:
+                # Creating an existing index is a no-op; other failures only cost filter speed
+                logger.warning(f"Payload index on {field_name} not created: {e}")
+
+    async def close(self):
+        """Close the Qdrant connection and the encoder thread"""
+        if self.qdrant_client:
+            await self.qdrant_client.close()
+        self._encoder_pool.shutdown(wait=False)
+
     def is_available(self) -> bool:
         """Check if service is available"""
         return self._is_available
 
-    async def generate_embedding(self, text: str) -> List[float]:
+    async def generate_embedding(self, text: str) -> np.ndarray:
         """
         Generate CLIP embedding for text
 
+        Calls arriving within CLIP_BATCH_WAIT_MS of each other are encoded
+        together (see _encode_batch).
+
         Args:
             text: Description text
 
         Returns:
-            List of floats (embedding vector)
+            float32 array of shape (512,), unit length
         """
         try:
-            if not self.embedding_model:
-                raise Exception("Embedding model not initialized")
-
-            embedding = self.embedding_model.encode(text)
-            return embedding.tolist()
+            return await self._encode_queue.submit(text)
 
         except Exception as e:
             logger.error(f"Embedding generation error: {e}")
             raise
 
+    async def _encode_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """Encode a batch of texts in one CLIP forward pass"""
+        def encode():
+            # Resolved here so the lazy model load also runs on the encoder thread
+            return self.embedding_model.encode(
+                texts,
+                batch_size=len(texts),
+                normalize_embeddings=True,
+                convert_to_numpy=True
+            )
+
+        embeddings = await asyncio.get_running_loop().run_in_executor(self._encoder_pool, encode)
+        # Rows stay float32 arrays; qdrant-client takes numpy vectors directly
+        return list(np.asarray(embeddings, dtype=np.float32))
+
     async def index_asset(
         self,
         asset_id: str,
         description: str,
-        embedding: List[float],
+        embedding: np.ndarray,
         metadata: Dict
     ):
         """
         Index an asset in Qdrant
 
+        Calls arriving within INDEX_BATCH_WAIT_MS of each other are written
+        in one upsert (see index_assets_batch).
+
         Args:
             asset_id: Unique asset ID
             description: Asset description
             embedding: Vector embedding
             metadata: Additional metadata (workspace, name, etc.)
         """
+        await self._index_queue.submit({
+            "asset_id": asset_id,
+            "description": description,
+            "embedding": embedding,
+            "metadata": metadata
+        })
+
+    async def index_assets_batch(self, items: List[Dict]) -> List[str]:
+        """
+        Index several assets with a single upsert request
+
+        Args:
+            items: Dicts with asset_id, description, embedding, and metadata
+
+        Returns:
+            Qdrant point IDs, in the order of items
+        """
         try:
             if not self.qdrant_client:
                 raise Exception("Qdrant client not initialized")
 
-            point = PointStruct(
-                id=str(uuid.uuid4()),  # Qdrant point ID
-                vector=embedding,
-                payload={
-                    "asset_id": asset_id,
-                    "description": description,
-                    **metadata
-                }
-            )
-
-            self.qdrant_client.upsert(
+            # Cached embeddings are dequantized from int8 and only roughly unit length
+            vectors = _unit_vectors([item["embedding"] for item in items])
+            points = [
+                PointStruct(
+                    id=_point_id(item["asset_id"]),
+                    vector=vector,
+                    payload={
+                        "asset_id": item["asset_id"],
+                        "description": item["description"],
+                        **item["metadata"]
+                    }
+                )
+                for item, vector in zip(items, vectors)
+            ]
+
+            # Points indexed before IDs were derived from asset_id have random
+            # IDs; drop those in the same request so re-indexing leaves no duplicate
+            legacy = FilterSelector(filter=Filter(
+                must=[FieldCondition(key="asset_id", match=MatchAny(any=[item["asset_id"] for item in items]))],
+                must_not=[HasIdCondition(has_id=[point.id for point in points])]
+            ))
+            # Wait until the points are applied, so a rejected write surfaces as
+            # an error and the cache is not refilled from the old index
+            await self.qdrant_client.batch_update_points(
                 collection_name=self.collection_name,
-                points=[point]
+                update_operations=[
+                    UpsertOperation(upsert=PointsList(points=points)),
+                    DeleteOperation(delete=legacy)
+                ],
+                wait=True
             )
 
-            logger.info(f"Indexed asset {asset_id} in Qdrant")
+            await self.semantic_cache.clear()
+            logger.info(f"Indexed {len(points)} assets in Qdrant")
+            return [point.id for point in points]
 
         except Exception as e:
             logger.error(f"Indexing error: {e}")
             raise
 
-    async def search(self, query: str, limit: int = 20) -> List[Dict]:
+    async def search(
+        self,
+        query: str,
+        limit: int = 20,
+        query_embedding: Optional[np.ndarray] = None
+    ) -> List[Dict]:
         """
         Search for similar assets using text query
 
         Args:
             query: Search query text
             limit: Number of results to return
+            query_embedding: Precomputed unit-length embedding of query (skips CLIP encoding)
 
         Returns:
             List of dicts with asset_id, score, and description
         """
         try:
-            if not self.qdrant_client or not self.embedding_model:
+            if not self.qdrant_client:
                 raise Exception("Vector search not available")
 
             # Generate embedding for query
-            query_embedding = await self.generate_embedding(query)
+            if query_embedding is None:
+                query_embedding = await self.generate_embedding(query)
+
+            # Near-duplicate of a recent query: reuse its results
+            cached = await self.semantic_cache.get(query_embedding, limit)
+            if cached is not None:
+                logger.info(f"Search for '{query}' served from semantic cache")
+                return cached
 
             # Search in Qdrant using the new API (qdrant-client >= 1.8)
-            response = self.qdrant_client.query_points(
+            response = await self.qdrant_client.query_points(
                 collection_name=self.collection_name,
                 query=query_embedding,
-                limit=limit
+                limit=limit,
+                with_payload=RESULT_FIELDS,
+                with_vectors=False,
+                search_params=SearchParams(
+                    # By default the beam scales with limit so large pages keep their recall
+                    hnsw_ef=self.hnsw_ef or max(64, limit * 4),
+                    quantization=QUANTIZATION_SEARCH_PARAMS
+                )
             )
             results = response.points
 
@@ -184,11 +447,13 @@ class VectorSearchService:
                 formatted_results.append({
                     "asset_id": point.payload.get("asset_id"),
                     "score": float(point.score),
+                    # with_payload only selects fields; metadata may lack them
                     "description": point.payload.get("description", ""),
                     "workspace": point.payload.get("workspace", ""),
                     "name": point.payload.get("name", "")
                 })
 
+            await self.semantic_cache.put(query_embedding, limit, formatted_results)
             logger.info(f"Search for '{query}' returned {len(formatted_results)} results")
             return formatted_results
 
@@ -207,19 +472,17 @@ class VectorSearchService:
             if not self.qdrant_client:
                 raise Exception("Qdrant client not initialized")
 
-            # Delete by filtering on asset_id
-            self.qdrant_client.delete(
+            # By payload rather than _point_id, so points indexed with random IDs
+            # before the switch are removed too (asset_id has a keyword index)
+            await self.qdrant_client.delete(
                 collection_name=self.collection_name,
-                points_selector=Filter(
-                    must=[
-                        FieldCondition(
-                            key="asset_id",
-                            match=MatchValue(value=asset_id)
-                        )
-                    ]
-                )
+                points_selector=FilterSelector(filter=Filter(
+                    must=[FieldCondition(key="asset_id", match=MatchValue(value=asset_id))]
+                )),
+                wait=True
             )
 
+            await self.semantic_cache.clear()
             logger.info(f"Deleted asset {asset_id} from index")
 
         except Exception as e: